@@ -1,28 +1,49 @@
 """Analytics module for usage tracking and insights."""
 
 import asyncio
-from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Any
-from sqlalchemy import create_engine, Column, String, Integer, Float, DateTime
+import queue
+import threading
+import time
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Any, Tuple
+from sqlalchemy import (
+    create_engine, event, case, delete, text, Column, Index, String, Integer, Float,
+    Date, DateTime
+)
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
 from sqlalchemy.sql import func
 import logging
 
-from .config import ANALYTICS_DB, ENABLE_ANALYTICS
+try:
+    import fcntl
+except ImportError:  # Windows: no file locks, assume a single process
+    fcntl = None
+
+from .config import ANALYTICS_DB, ANALYTICS_ROLLUP_INTERVAL, ENABLE_ANALYTICS
 
 logger = logging.getLogger("chaxai.analytics")
 
 Base = declarative_base()
 
+# On Postgres the raw tables are range-partitioned by month on timestamp so
+# summary queries only touch recent partitions. Postgres requires the
+# partition key to be part of the primary key.
+PARTITIONED = ANALYTICS_DB.startswith("postgresql")
+_PARTITION_ARGS = {"postgresql_partition_by": "RANGE (timestamp)"} if PARTITIONED else {}
+
 
 class APIUsage(Base):
     """API usage tracking table."""
     
     __tablename__ = "api_usage"
+    # Only read by the rollup, which filters on timestamp alone; extra
+    # indexes would just slow down the inserts
+    __table_args__ = (_PARTITION_ARGS,)
     
-    id = Column(Integer, primary_key=True)
-    tenant_id = Column(String, index=True)
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    tenant_id = Column(String)
     user_id = Column(String, index=True)
     endpoint = Column(String)
     method = Column(String)
@@ -30,16 +51,20 @@ class APIUsage(Base):
     response_time = Column(Float)
     tokens_used = Column(Integer)
     model = Column(String)
-    timestamp = Column(DateTime, default=datetime.utcnow, index=True)
+    timestamp = Column(DateTime, default=datetime.utcnow, index=True, primary_key=PARTITIONED)
 
 
 class QueryLog(Base):
     """Query logging table."""
     
     __tablename__ = "query_log"
+    __table_args__ = (
+        Index("ix_query_tenant_ts", "tenant_id", "timestamp"),
+        _PARTITION_ARGS,
+    )
     
-    id = Column(Integer, primary_key=True)
-    tenant_id = Column(String, index=True)
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    tenant_id = Column(String)
     user_id = Column(String, index=True)
     query = Column(String)
     response_preview = Column(String)
@@ -47,17 +72,207 @@ class QueryLog(Base):
     confidence = Column(Float)
     model = Column(String)
     processing_time = Column(Float)
-    timestamp = Column(DateTime, default=datetime.utcnow, index=True)
+    timestamp = Column(DateTime, default=datetime.utcnow, index=True, primary_key=PARTITIONED)
+
+
+class DailyTenantStats(Base):
+    """Per-tenant daily rollup of api_usage and query_log.
+    
+    Sums are stored instead of averages so that any range of days can be
+    combined exactly.
+    """
+    
+    __tablename__ = "daily_tenant_stats"
+    
+    tenant_id = Column(String, primary_key=True)
+    date = Column(Date, primary_key=True)
+    requests = Column(Integer, default=0)
+    tokens = Column(Integer, default=0)
+    response_time_sum = Column(Float, default=0.0)
+    errors = Column(Integer, default=0)
+    queries = Column(Integer, default=0)
+    confidence_sum = Column(Float, default=0.0)
+    processing_time_sum = Column(Float, default=0.0)
+
+
+# SQLite tuning for append-heavy telemetry: WAL lets readers run during
+# writes and synchronous=NORMAL avoids an fsync on every commit.
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA cache_size=-65536",
+)
+
+
+def _create_engine(url: str):
+    """Create the analytics engine with pooling and SQLite pragmas."""
+    if not url.startswith("sqlite"):
+        return create_engine(url, pool_size=5, max_overflow=10)
+    
+    if ":memory:" in url or url.rstrip("/") == "sqlite:":
+        engine = create_engine(
+            url,
+            connect_args={"check_same_thread": False},
+            poolclass=StaticPool
+        )
+    else:
+        engine = create_engine(
+            url,
+            connect_args={"check_same_thread": False},
+            pool_size=5,
+            max_overflow=10,
+            pool_pre_ping=False
+        )
+    
+    @event.listens_for(engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in SQLITE_PRAGMAS:
+            cursor.execute(pragma)
+        cursor.close()
+    
+    return engine
+
+
+def _next_month(day: date) -> date:
+    return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def ensure_partitions(months_ahead: int = 1):
+    """Create monthly partitions up to months_ahead past the current month.
+    
+    Rows outside every monthly range land in a DEFAULT partition. No-op
+    unless the analytics database is Postgres.
+    """
+    if not (ENABLE_ANALYTICS and PARTITIONED):
+        return
+    
+    try:
+        with engine.begin() as conn:
+            for table in (APIUsage.__tablename__, QueryLog.__tablename__):
+                conn.execute(text(
+                    f"CREATE TABLE IF NOT EXISTS {table}_default "
+                    f"PARTITION OF {table} DEFAULT"
+                ))
+                month = datetime.utcnow().date().replace(day=1)
+                for _ in range(months_ahead + 1):
+                    end = _next_month(month)
+                    conn.execute(text(
+                        f"CREATE TABLE IF NOT EXISTS {table}_{month:%Y_%m} "
+                        f"PARTITION OF {table} "
+                        f"FOR VALUES FROM ('{month}') TO ('{end}')"
+                    ))
+                    month = end
+    except Exception as e:
+        logger.error(f"Failed to create analytics partitions: {e}")
 
 
 # Initialize database
 if ENABLE_ANALYTICS:
-    engine = create_engine(ANALYTICS_DB)
+    engine = _create_engine(ANALYTICS_DB)
     Base.metadata.create_all(engine)
+    ensure_partitions()
     SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Rows are buffered and written in batches by a dedicated writer thread
+FLUSH_BATCH_SIZE = 500
+FLUSH_INTERVAL = 0.2
+
+# Long queries are truncated to this many UTF-8 bytes before storage
+QUERY_MAX_BYTES = 2048
 
-async def track_api_usage(
+# Events are dropped (and counted) rather than blocking callers when the
+# writer falls this far behind
+WRITE_QUEUE_MAXSIZE = 100_000
+
+_write_queue: "queue.Queue[Tuple[Any, Dict[str, Any]]]" = queue.Queue(
+    maxsize=WRITE_QUEUE_MAXSIZE
+)
+dropped_events = 0
+_writer_thread: Optional[threading.Thread] = None
+_writer_lock = threading.Lock()
+
+# Queued by shutdown_analytics to make the writer flush and exit
+_STOP = object()
+
+
+def _insert_batch(table, rows: List[Dict[str, Any]]):
+    """Insert a batch of rows in a single transaction."""
+    try:
+        with engine.begin() as conn:
+            conn.execute(table.insert(), rows)
+    except Exception as e:
+        logger.error(f"Failed to write {len(rows)} rows to {table.name}: {e}")
+
+
+def _flush(batch: List[Tuple[Any, Dict[str, Any]]]):
+    """Write buffered rows grouped by table."""
+    by_table: Dict[Any, List[Dict[str, Any]]] = {}
+    for table, row in batch:
+        by_table.setdefault(table, []).append(row)
+    for table, rows in by_table.items():
+        _insert_batch(table, rows)
+
+
+def _writer_loop():
+    """Flush queued rows every FLUSH_BATCH_SIZE rows or FLUSH_INTERVAL seconds."""
+    batch = []
+    deadline = time.monotonic() + FLUSH_INTERVAL
+    while True:
+        timeout = deadline - time.monotonic()
+        try:
+            if timeout > 0:
+                item = _write_queue.get(timeout=timeout)
+                if item is _STOP:
+                    if batch:
+                        _flush(batch)
+                    return
+                batch.append(item)
+                if len(batch) < FLUSH_BATCH_SIZE:
+                    continue
+        except queue.Empty:
+            pass
+        if batch:
+            _flush(batch)
+            batch = []
+        deadline = time.monotonic() + FLUSH_INTERVAL
+
+
+def _start_writer():
+    """Start the analytics writer thread once per process."""
+    global _writer_thread
+    if _writer_thread is not None:
+        return
+    with _writer_lock:
+        if _writer_thread is None:
+            _writer_thread = threading.Thread(
+                target=_writer_loop, name="analytics-writer", daemon=True
+            )
+            _writer_thread.start()
+
+
+def _enqueue(table, row: Dict[str, Any]):
+    """Hand a row to the writer thread, dropping it if the queue is full."""
+    global dropped_events
+    _start_writer()
+    try:
+        _write_queue.put_nowait((table, row))
+    except queue.Full:
+        dropped_events += 1
+        if dropped_events % 1000 == 1:
+            logger.warning(f"Analytics queue full; {dropped_events} events dropped so far")
+
+
+def _truncate_utf8(text: str, max_bytes: int) -> str:
+    """Truncate text to at most max_bytes of UTF-8 without splitting a character."""
+    if len(text) * 4 <= max_bytes:
+        return text
+    return text.encode("utf-8")[:max_bytes].decode("utf-8", errors="ignore")
+
+
+def track_api_usage(
     endpoint: str,
     method: str,
     status_code: int,
@@ -67,34 +282,24 @@ async def track_api_usage(
     tokens_used: Optional[int] = None,
     model: Optional[str] = None
 ):
-    """Track API usage asynchronously."""
+    """Queue API usage for the background writer (non-blocking)."""
     if not ENABLE_ANALYTICS:
         return
     
-    def _track():
-        try:
-            session = SessionLocal()
-            usage = APIUsage(
-                tenant_id=tenant_id,
-                user_id=user_id,
-                endpoint=endpoint,
-                method=method,
-                status_code=status_code,
-                response_time=response_time,
-                tokens_used=tokens_used,
-                model=model
-            )
-            session.add(usage)
-            session.commit()
-            session.close()
-        except Exception as e:
-            logger.error(f"Failed to track API usage: {e}")
-    
-    # Run in background
-    asyncio.create_task(asyncio.to_thread(_track))
+    _enqueue(APIUsage.__table__, dict(
+        tenant_id=tenant_id,
+        user_id=user_id,
+        endpoint=endpoint,
+        method=method,
+        status_code=status_code,
+        response_time=response_time,
+        tokens_used=tokens_used,
+        model=model,
+        timestamp=datetime.utcnow()
+    ))
 
 
-async def track_query(
+def track_query(
     query: str,
     response_preview: str,
     sources_count: int,
@@ -104,41 +309,190 @@ async def track_query(
     tenant_id: str,
     user_id: Optional[str] = None
 ):
-    """Track query details asynchronously."""
+    """Queue query details for the background writer (non-blocking)."""
     if not ENABLE_ANALYTICS:
         return
     
-    def _track():
-        try:
-            session = SessionLocal()
-            log = QueryLog(
-                tenant_id=tenant_id,
-                user_id=user_id,
-                query=query[:500],  # Truncate long queries
-                response_preview=response_preview[:200],
-                sources_count=sources_count,
-                confidence=confidence,
-                model=model,
-                processing_time=processing_time
+    _enqueue(QueryLog.__table__, dict(
+        tenant_id=tenant_id,
+        user_id=user_id,
+        query=_truncate_utf8(query, QUERY_MAX_BYTES),
+        response_preview=response_preview[:200],
+        sources_count=sources_count,
+        confidence=confidence,
+        model=model,
+        processing_time=processing_time,
+        timestamp=datetime.utcnow()
+    ))
+
+
+def _as_date(value) -> date:
+    """Normalize func.date() results (str on SQLite, date elsewhere)."""
+    if isinstance(value, str):
+        return date.fromisoformat(value)
+    return value
+
+
+def refresh_rollups():
+    """Recompute daily_tenant_stats from the last rolled-up day onwards.
+    
+    The watermark is read from the table itself, so restarts and changes of
+    rollup process do not trigger a full rebuild. Only an empty table is
+    rebuilt from the whole raw history; rows for days older than the
+    watermark are kept even if their raw partitions were detached.
+    """
+    if not ENABLE_ANALYTICS:
+        return
+    
+    session = SessionLocal()
+    try:
+        since = None
+        last_day = session.query(func.max(DailyTenantStats.date)).scalar()
+        if last_day is not None:
+            # Re-aggregate from the day before the newest rolled-up day, so
+            # rows still buffered by the writer around midnight are counted
+            since_day = _as_date(last_day) - timedelta(days=1)
+            since = datetime.combine(since_day, datetime.min.time())
+        
+        api_date = func.date(APIUsage.timestamp)
+        api_query = session.query(
+            APIUsage.tenant_id,
+            api_date.label("date"),
+            func.count(APIUsage.id).label("requests"),
+            func.sum(APIUsage.tokens_used).label("tokens"),
+            func.sum(APIUsage.response_time).label("response_time_sum"),
+            func.sum(case((APIUsage.status_code >= 400, 1), else_=0)).label("errors")
+        )
+        query_date = func.date(QueryLog.timestamp)
+        query_query = session.query(
+            QueryLog.tenant_id,
+            query_date.label("date"),
+            func.count(QueryLog.id).label("queries"),
+            func.sum(QueryLog.confidence).label("confidence_sum"),
+            func.sum(QueryLog.processing_time).label("processing_time_sum")
+        )
+        if since is not None:
+            api_query = api_query.filter(APIUsage.timestamp >= since)
+            query_query = query_query.filter(QueryLog.timestamp >= since)
+        
+        rows: Dict[Tuple[str, date], Dict[str, Any]] = {}
+        
+        def _row(tenant_id, day):
+            key = (tenant_id, _as_date(day))
+            if key not in rows:
+                rows[key] = {
+                    "tenant_id": key[0], "date": key[1],
+                    "requests": 0, "tokens": 0, "response_time_sum": 0.0,
+                    "errors": 0, "queries": 0, "confidence_sum": 0.0,
+                    "processing_time_sum": 0.0,
+                }
+            return rows[key]
+        
+        for r in api_query.group_by(APIUsage.tenant_id, api_date):
+            _row(r.tenant_id, r.date).update(
+                requests=r.requests,
+                tokens=r.tokens or 0,
+                response_time_sum=r.response_time_sum or 0.0,
+                errors=r.errors or 0
+            )
+        for r in query_query.group_by(QueryLog.tenant_id, query_date):
+            _row(r.tenant_id, r.date).update(
+                queries=r.queries,
+                confidence_sum=r.confidence_sum or 0.0,
+                processing_time_sum=r.processing_time_sum or 0.0
             )
-            session.add(log)
-            session.commit()
-            session.close()
+        
+        table = DailyTenantStats.__table__
+        stale = delete(table)
+        if since is not None:
+            stale = stale.where(table.c.date >= since.date())
+        session.execute(stale)
+        if rows:
+            session.execute(table.insert(), list(rows.values()))
+        session.commit()
+        
+    except Exception as e:
+        session.rollback()
+        logger.error(f"Failed to refresh analytics rollups: {e}")
+    finally:
+        session.close()
+
+
+# Only one process (e.g. one gunicorn worker) refreshes rollups. It holds a
+# Postgres advisory lock, or a lock file next to a SQLite database, for its
+# lifetime; the other workers retry every cycle in case the holder exits.
+ROLLUP_LOCK_KEY = 0x63686178
+_rollup_lock_handle: Any = None
+
+
+def _acquire_rollup_lock() -> bool:
+    """Return True if this process is (now) the one that refreshes rollups."""
+    global _rollup_lock_handle
+    if _rollup_lock_handle is not None:
+        return True
+    
+    if engine.dialect.name == "postgresql":
+        conn = engine.connect()
+        try:
+            acquired = conn.execute(
+                text("SELECT pg_try_advisory_lock(:key)"), {"key": ROLLUP_LOCK_KEY}
+            ).scalar()
+            # Session-level advisory locks survive the commit; this only
+            # avoids leaving the connection idle in a transaction
+            conn.commit()
         except Exception as e:
-            logger.error(f"Failed to track query: {e}")
+            conn.close()
+            logger.error(f"Failed to take analytics rollup lock: {e}")
+            return False
+        if not acquired:
+            conn.close()
+            return False
+        _rollup_lock_handle = conn
+        return True
     
-    # Run in background
-    asyncio.create_task(asyncio.to_thread(_track))
+    database = engine.url.database
+    if fcntl is None or not database or database == ":memory:":
+        # In-memory databases are private to this process
+        _rollup_lock_handle = True
+        return True
+    
+    lock_file = open(f"{database}.rollup.lock", "w")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return False
+    _rollup_lock_handle = lock_file
+    return True
+
+
+async def run_rollups():
+    """Refresh rollups every ANALYTICS_ROLLUP_INTERVAL seconds in one process."""
+    while True:
+        if await asyncio.to_thread(_acquire_rollup_lock):
+            await asyncio.to_thread(ensure_partitions)
+            await asyncio.to_thread(refresh_rollups)
+        await asyncio.sleep(ANALYTICS_ROLLUP_INTERVAL)
 
 
 async def get_analytics_summary(
     tenant_id: str,
     period_days: int = 30
 ) -> Dict[str, Any]:
-    """Get analytics summary for a tenant."""
+    """Get analytics summary for a tenant.
+    
+    Totals are read from the daily_tenant_stats rollup, so they lag the raw
+    tables by at most ANALYTICS_ROLLUP_INTERVAL seconds.
+    """
     if not ENABLE_ANALYTICS:
         return {"error": "Analytics not enabled"}
     
+    # The queries are synchronous; keep them off the event loop
+    return await asyncio.to_thread(_summary_sync, tenant_id, period_days)
+
+
+def _summary_sync(tenant_id: str, period_days: int) -> Dict[str, Any]:
+    """Build the analytics summary using blocking database calls."""
     session = SessionLocal()
     
     try:
@@ -146,25 +500,16 @@ async def get_analytics_summary(
         end_date = datetime.utcnow()
         start_date = end_date - timedelta(days=period_days)
         
-        # API usage stats
-        api_stats = session.query(
-            func.count(APIUsage.id).label("total_requests"),
-            func.avg(APIUsage.response_time).label("avg_response_time"),
-            func.sum(APIUsage.tokens_used).label("total_tokens")
-        ).filter(
-            APIUsage.tenant_id == tenant_id,
-            APIUsage.timestamp >= start_date
-        ).first()
+        # One pass over the rollup yields both the totals and the daily trend
+        days = session.query(DailyTenantStats).filter(
+            DailyTenantStats.tenant_id == tenant_id,
+            DailyTenantStats.date >= start_date.date()
+        ).order_by(DailyTenantStats.date).all()
         
-        # Query stats
-        query_stats = session.query(
-            func.count(QueryLog.id).label("total_queries"),
-            func.avg(QueryLog.confidence).label("avg_confidence"),
-            func.avg(QueryLog.processing_time).label("avg_processing_time")
-        ).filter(
-            QueryLog.tenant_id == tenant_id,
-            QueryLog.timestamp >= start_date
-        ).first()
+        total_requests = sum(d.requests or 0 for d in days)
+        total_queries = sum(d.queries or 0 for d in days)
+        total_tokens = sum(d.tokens or 0 for d in days)
+        total_errors = sum(d.errors or 0 for d in days)
         
         # Top models
         top_models = session.query(
@@ -175,42 +520,34 @@ async def get_analytics_summary(
             QueryLog.timestamp >= start_date
         ).group_by(QueryLog.model).order_by(func.count(QueryLog.id).desc()).limit(5).all()
         
-        # Daily trends
-        daily_trends = session.query(
-            func.date(QueryLog.timestamp).label("date"),
-            func.count(QueryLog.id).label("queries")
-        ).filter(
-            QueryLog.tenant_id == tenant_id,
-            QueryLog.timestamp >= start_date
-        ).group_by(func.date(QueryLog.timestamp)).all()
-        
-        # Error rate
-        total_requests = api_stats.total_requests or 0
-        error_requests = session.query(func.count(APIUsage.id)).filter(
-            APIUsage.tenant_id == tenant_id,
-            APIUsage.timestamp >= start_date,
-            APIUsage.status_code >= 400
-        ).scalar() or 0
+        def _avg(values, count):
+            return sum(v or 0 for v in values) / count if count > 0 else 0
         
-        error_rate = (error_requests / total_requests * 100) if total_requests > 0 else 0
+        error_rate = (total_errors / total_requests * 100) if total_requests > 0 else 0
         
         return {
             "tenant_id": tenant_id,
             "period": f"Last {period_days} days",
-            "total_queries": query_stats.total_queries or 0,
-            "total_requests": api_stats.total_requests or 0,
-            "total_tokens": api_stats.total_tokens or 0,
-            "average_response_time": round(api_stats.avg_response_time or 0, 3),
-            "average_confidence": round(query_stats.avg_confidence or 0, 1),
-            "average_processing_time": round(query_stats.avg_processing_time or 0, 3),
+            "total_queries": total_queries,
+            "total_requests": total_requests,
+            "total_tokens": total_tokens,
+            "average_response_time": round(
+                _avg((d.response_time_sum for d in days), total_requests), 3
+            ),
+            "average_confidence": round(
+                _avg((d.confidence_sum for d in days), total_queries), 1
+            ),
+            "average_processing_time": round(
+                _avg((d.processing_time_sum for d in days), total_queries), 3
+            ),
             "error_rate": round(error_rate, 2),
             "top_models": [
                 {"model": m.model, "count": m.count}
                 for m in top_models
             ],
             "query_trends": [
-                {"date": str(t.date), "count": t.queries}
-                for t in daily_trends
+                {"date": str(d.date), "count": d.queries}
+                for d in days if d.queries
             ]
         }
         
@@ -221,6 +558,29 @@ async def get_analytics_summary(
 def init_analytics():
     """Initialize analytics module."""
     if ENABLE_ANALYTICS:
+        _start_writer()
         logger.info("Analytics module initialized")
     else:
         logger.info("Analytics module disabled")
+
+
+def shutdown_analytics(timeout: float = 10.0):
+    """Flush queued events and stop the writer thread.
+    
+    Waits at most timeout seconds in total; events still queued after that
+    (e.g. because the database is stalled) are logged as lost.
+    """
+    thread = _writer_thread
+    if thread is None or not thread.is_alive():
+        return
+    
+    deadline = time.monotonic() + timeout
+    try:
+        _write_queue.put(_STOP, timeout=timeout)
+    except queue.Full:
+        pass
+    thread.join(max(0.0, deadline - time.monotonic()))
+    if thread.is_alive():
+        logger.warning(
+            f"Analytics writer did not finish; about {_write_queue.qsize()} events lost"
+        )
@@ -1,4 +1,5 @@
 import os
+from functools import lru_cache
 from pathlib import Path
 from dotenv import load_dotenv
 from cryptography.fernet import Fernet
@@ -9,11 +10,6 @@ ENV_PATH = BASE_DIR / '.env'
 
 load_dotenv(dotenv_path=ENV_PATH)
 
-# Create directories if they don't exist
-for dir_name in ['vectorstore', 'cache', 'logs', 'docs']:
-    dir_path = BASE_DIR / dir_name
-    dir_path.mkdir(exist_ok=True)
-
 # Directories
 VECTOR_DIR = os.getenv("VECTORSTORE_DIR", str(BASE_DIR / "vectorstore"))
 DOCS_DIR = BASE_DIR / "docs"
@@ -47,6 +43,8 @@ ENCRYPTION_KEY = encryption_key
 JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY", "your-secret-key-here")
 JWT_ALGORITHM = "HS256"
 JWT_EXPIRATION_HOURS = int(os.getenv("JWT_EXPIRATION_HOURS", "24"))
+# bcrypt work factor; tests can lower it (e.g. 4) via the environment
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
 
 # Rate Limiting
 RATE_LIMIT_REQUESTS = int(os.getenv("RATE_LIMIT_REQUESTS", "60"))
@@ -56,6 +54,8 @@ RATE_LIMIT_WINDOW = int(os.getenv("RATE_LIMIT_WINDOW", "60"))
 LOG_LEVEL = os.getenv("LOG_LEVEL", "info").upper()
 LOG_FILE = os.getenv("LOG_FILE", "logs/chaxai.log")
 AUDIT_LOG_FILE = os.getenv("AUDIT_LOG_FILE", "logs/audit.log")
+LOG_BUFFER_RECORDS = int(os.getenv("LOG_BUFFER_RECORDS", "1024"))
+AUDIT_LOG_BUFFER_RECORDS = int(os.getenv("AUDIT_LOG_BUFFER_RECORDS", "4096"))
 
 # Multi-tenant
 ENABLE_MULTI_TENANT = os.getenv("ENABLE_MULTI_TENANT", "false").lower() == "true"
@@ -64,23 +64,48 @@ DEFAULT_TENANT_ID = os.getenv("DEFAULT_TENANT_ID", "default")
 # Analytics
 ENABLE_ANALYTICS = os.getenv("ENABLE_ANALYTICS", "true").lower() == "true"
 ANALYTICS_DB = os.getenv("ANALYTICS_DB", "sqlite:///analytics.db")
+ANALYTICS_ROLLUP_INTERVAL = int(os.getenv("ANALYTICS_ROLLUP_INTERVAL", "3600"))
 
+@lru_cache(maxsize=1)
 def get_encryption_cipher():
-    """Get Fernet cipher for encryption/decryption."""
+    """Get Fernet cipher for encryption/decryption (built once per process).
+
+    The shared instance is safe to use from multiple threads; Fernet keeps
+    no mutable state between encrypt/decrypt calls.
+    """
     return Fernet(ENCRYPTION_KEY.encode())
 
+_DIRS_INITIALIZED = False
+
+def ensure_dirs():
+    """Create the backend's working directories (once per process)."""
+    global _DIRS_INITIALIZED
+    if _DIRS_INITIALIZED:
+        return
+    for dir_name in ("vectorstore", "cache", "logs", "docs"):
+        (BASE_DIR / dir_name).mkdir(parents=True, exist_ok=True)
+    _DIRS_INITIALIZED = True
+
+_LOGGING_CONFIGURED = False
+
 def configure_logging():
-    """Configure comprehensive logging with rotation."""
-    from logging.handlers import RotatingFileHandler, TimedRotatingFileHandler
+    """Configure comprehensive logging with rotation (once per process)."""
+    from logging.handlers import (
+        MemoryHandler, RotatingFileHandler, TimedRotatingFileHandler
+    )
+    
+    global _LOGGING_CONFIGURED
+    if _LOGGING_CONFIGURED:
+        return
+    _LOGGING_CONFIGURED = True
     
-    # Ensure log directory exists
-    log_dir = Path(LOG_FILE).parent
-    log_dir.mkdir(exist_ok=True)
+    ensure_dirs()
     
     # Configure root logger
     logging.basicConfig(
         level=LOG_LEVEL,
-        format="%(asctime)s [%(levelname)s] %(name)s: %(message)s"
+        format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
+        force=True
     )
     
     # Main application logger
@@ -88,6 +113,7 @@ def configure_logging():
     app_logger.setLevel(LOG_LEVEL)
     
     if LOG_FILE:
+        os.makedirs(os.path.dirname(LOG_FILE) or ".", exist_ok=True)
         app_handler = RotatingFileHandler(
             LOG_FILE, maxBytes=10_000_000, backupCount=5
         )
@@ -96,12 +122,15 @@ def configure_logging():
                 "%(asctime)s [%(levelname)s] %(name)s: %(message)s"
             )
         )
-        app_logger.addHandler(app_handler)
+        # Buffer records so file writes happen in batches; errors flush
+        # immediately and logging.shutdown() flushes the rest at exit
+        app_logger.addHandler(MemoryHandler(
+            LOG_BUFFER_RECORDS, flushLevel=logging.ERROR, target=app_handler
+        ))
     
     # Audit logger
     if AUDIT_LOG_FILE:
-        audit_log_dir = Path(AUDIT_LOG_FILE).parent
-        audit_log_dir.mkdir(exist_ok=True)
+        os.makedirs(os.path.dirname(AUDIT_LOG_FILE) or ".", exist_ok=True)
         
         audit_logger = logging.getLogger("chaxai.audit")
         audit_handler = TimedRotatingFileHandler(
@@ -110,7 +139,9 @@ def configure_logging():
         audit_handler.setFormatter(
             logging.Formatter("%(asctime)s [AUDIT] %(message)s")
         )
-        audit_logger.addHandler(audit_handler)
+        audit_logger.addHandler(MemoryHandler(
+            AUDIT_LOG_BUFFER_RECORDS, flushLevel=logging.ERROR, target=audit_handler
+        ))
         audit_logger.setLevel(logging.INFO)
 
 def validate_config():
@@ -1,11 +1,11 @@
 """Grok API client with enterprise features."""
 
 import asyncio
-import json
 import logging
+import time
 from typing import AsyncGenerator, Dict, List, Optional, Any
-from datetime import datetime
 import httpx
+import orjson
 from tenacity import retry, stop_after_attempt, wait_exponential
 
 from .config import (
@@ -17,6 +17,33 @@ from .analytics import track_api_usage
 logger = logging.getLogger("chaxai.grok")
 
 
+def _extract_content(chunk: Dict[str, Any]) -> Optional[str]:
+    """Return the delta text of a streamed completion chunk, if any."""
+    choices = chunk.get("choices")
+    if not choices:
+        return None
+    return choices[0].get("delta", {}).get("content")
+
+
+async def _iter_sse_data(response: httpx.Response) -> AsyncGenerator[bytes, None]:
+    """Yield raw SSE ``data:`` payloads until ``[DONE]``.
+    
+    Works on bytes so payloads go straight to orjson without a UTF-8
+    decode/re-encode round trip per line.
+    """
+    buffer = bytearray()
+    async for raw in response.aiter_bytes():
+        buffer += raw
+        while (newline := buffer.find(b"\n")) >= 0:
+            line = bytes(buffer[:newline]).rstrip(b"\r")
+            del buffer[:newline + 1]
+            if line.startswith(b"data: "):
+                data = line[6:]
+                if data == b"[DONE]":
+                    return
+                yield data
+
+
 class GrokClient:
     """Enterprise-grade Grok API client with streaming support."""
     
@@ -31,13 +58,23 @@ class GrokClient:
         self.base_url = base_url.rstrip("/")
         self.model = model
         self.timeout = timeout
+        # HTTP/2 lets concurrent completions share one warm connection
         self.client = httpx.AsyncClient(
             base_url=self.base_url,
             headers={
                 "Authorization": f"Bearer {api_key}",
                 "Content-Type": "application/json",
             },
-            timeout=timeout
+            transport=httpx.AsyncHTTPTransport(
+                http2=True,
+                retries=0,
+                limits=httpx.Limits(
+                    max_keepalive_connections=50,
+                    max_connections=100,
+                    keepalive_expiry=60
+                )
+            ),
+            timeout=httpx.Timeout(timeout, connect=5.0)
         )
     
     async def __aenter__(self):
@@ -74,10 +111,10 @@ class GrokClient:
             payload["tool_choice"] = "auto"
         
         try:
-            start_time = datetime.utcnow()
+            start_ns = time.perf_counter_ns()
             
             if stream:
-                return await self._stream_chat_completion(payload, metadata)
+                return self._stream_chat_completion(payload, metadata)
             else:
                 response = await self.client.post(
                     "/chat/completions",
@@ -89,10 +126,13 @@ class GrokClient:
                 
                 # Track usage
                 if metadata:
-                    await track_api_usage(
+                    track_api_usage(
+                        endpoint="/chat/completions",
+                        method="POST",
+                        status_code=response.status_code,
+                        response_time=(time.perf_counter_ns() - start_ns) / 1e9,
                         model=self.model,
                         tokens_used=result.get("usage", {}).get("total_tokens", 0),
-                        latency=(datetime.utcnow() - start_time).total_seconds(),
                         tenant_id=metadata.get("tenant_id"),
                         user_id=metadata.get("user_id")
                     )
@@ -110,7 +150,7 @@ class GrokClient:
     ) -> AsyncGenerator[str, None]:
         """Stream chat completion responses."""
         
-        start_time = datetime.utcnow()
+        start_ns = time.perf_counter_ns()
         total_tokens = 0
         
         try:
@@ -121,29 +161,26 @@ class GrokClient:
             ) as response:
                 response.raise_for_status()
                 
-                async for line in response.aiter_lines():
-                    if line.startswith("data: "):
-                        data = line[6:]
-                        if data == "[DONE]":
-                            break
-                        
-                        try:
-                            chunk = json.loads(data)
-                            if chunk.get("choices", [{}])[0].get("delta", {}).get("content"):
-                                content = chunk["choices"][0]["delta"]["content"]
-                                yield content
-                                
-                                # Estimate tokens (rough approximation)
-                                total_tokens += len(content.split())
-                        except json.JSONDecodeError:
-                            logger.warning(f"Failed to parse SSE data: {data}")
+                async for data in _iter_sse_data(response):
+                    try:
+                        content = _extract_content(orjson.loads(data))
+                        if content:
+                            yield content
+                            
+                            # Estimate tokens (~4 characters per token)
+                            total_tokens += max(1, len(content) >> 2)
+                    except orjson.JSONDecodeError:
+                        logger.warning(f"Failed to parse SSE data: {data!r}")
                 
                 # Track usage for streaming
                 if metadata:
-                    await track_api_usage(
+                    track_api_usage(
+                        endpoint="/chat/completions",
+                        method="POST",
+                        status_code=response.status_code,
+                        response_time=(time.perf_counter_ns() - start_ns) / 1e9,
                         model=self.model,
-                        tokens_used=total_tokens * 1.3,  # Rough token estimate
-                        latency=(datetime.utcnow() - start_time).total_seconds(),
+                        tokens_used=total_tokens,
                         tenant_id=metadata.get("tenant_id"),
                         user_id=metadata.get("user_id")
                     )
@@ -1,15 +1,55 @@
 import asyncio
+import os
+import shutil
 import uuid
 from pathlib import Path
-from typing import List, Optional
+from typing import AsyncIterator, BinaryIO, Dict, List, Optional
 
 from fastapi import UploadFile
 from langchain.docstore.document import Document
+from langchain.text_splitter import RecursiveCharacterTextSplitter
 
 from .config import DOCS_DIR, MAX_UPLOAD_MB
+from .pdf_parse import get_parse_pool, read_pdf_pages
 from .utils import secure_filename
 from .vector_enhanced import vector_manager
 
+# Chunks are handed to the vector store in batches so a large PDF is never
+# held in memory as a single string
+INGEST_BATCH_SIZE = 500
+
+COPY_CHUNK_SIZE = 1 << 20
+
+# Below this many PDFs the process pool startup cost outweighs the gain
+PARALLEL_PARSE_THRESHOLD = 4
+
+_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
+
+
+def _copy_to_path(src: BinaryIO, dest: Path) -> None:
+    with open(dest, "wb") as f:
+        shutil.copyfileobj(src, f, COPY_CHUNK_SIZE)
+
+
+async def _pdf_pages(path: Path) -> AsyncIterator[str]:
+    from pypdf import PdfReader
+
+    reader = await asyncio.to_thread(PdfReader, str(path))
+    for page in reader.pages:
+        yield await asyncio.to_thread(page.extract_text) or ""
+
+
+async def _text_pages(path: Path) -> AsyncIterator[str]:
+    yield await asyncio.to_thread(path.read_text, encoding="utf-8", errors="ignore")
+
+
+# Supported upload types, keyed by lowercase suffix
+_PAGE_EXTRACTORS = {
+    ".pdf": _pdf_pages,
+    ".md": _text_pages,
+    ".txt": _text_pages,
+}
+
 
 class IngestManager:
     """Simple document ingestion manager."""
@@ -20,37 +60,97 @@ class IngestManager:
         self.docs_dir.mkdir(parents=True, exist_ok=True)
 
     async def validate_file(self, file: UploadFile) -> UploadFile:
-        ext = Path(file.filename).suffix.lower()
-        if ext not in {".txt", ".md", ".pdf"}:
+        ext = os.path.splitext(file.filename)[1].lower()
+        if ext not in _PAGE_EXTRACTORS:
             raise ValueError("Unsupported file type")
-        data = await file.read()
-        if len(data) > MAX_UPLOAD_MB * 1024 * 1024:
+        size = file.size
+        if size is None:
+            # Measure the spooled file without reading it into memory
+            size = await asyncio.to_thread(file.file.seek, 0, os.SEEK_END)
+            await asyncio.to_thread(file.file.seek, 0)
+        if size > MAX_UPLOAD_MB * 1024 * 1024:
             raise ValueError("File too large")
-        await file.seek(0)
         return file
 
     async def queue_ingestion(self, files: List[UploadFile], user_id: Optional[str] = None) -> str:
         task_id = uuid.uuid4().hex
+        saved = []
+        taken = set()
         for upload in files:
             secure_name = secure_filename(upload.filename)
-            dest = self.docs_dir / secure_name
-            content = await upload.read()
-            with open(dest, "wb") as f:
-                f.write(content)
-            await upload.seek(0)
-            text = await self._extract_text(dest)
-            document = Document(page_content=text, metadata={"source": secure_name, "tenant_id": self.tenant_id})
-            await vector_manager.get_store(self.tenant_id).add_documents([document])
+            # Uploads are saved concurrently, so two files that sanitize to
+            # the same name (a/report.pdf, b/report.pdf) must not share a path
+            stem, suffix = os.path.splitext(secure_name)
+            n = 1
+            while secure_name in taken:
+                secure_name = f"{stem}_{n}{suffix}"
+                n += 1
+            taken.add(secure_name)
+            saved.append((self.docs_dir / secure_name, secure_name))
+        await asyncio.gather(
+            *(self._save_upload(upload, dest) for upload, (dest, _) in zip(files, saved))
+        )
+
+        parsed = await self._parse_pdfs([dest for dest, _ in saved if dest.suffix.lower() == ".pdf"])
+        for dest, secure_name in saved:
+            await self._index_file(dest, secure_name, parsed.get(dest))
         return task_id
 
+    async def _save_upload(self, upload: UploadFile, dest: Path) -> None:
+        """Stream an upload to disk in fixed-size chunks off the event loop."""
+        await asyncio.to_thread(_copy_to_path, upload.file, dest)
+        await upload.seek(0)
+
+    async def _parse_pdfs(self, paths: List[Path]) -> Dict[Path, List[str]]:
+        """Parse PDFs across worker processes when there are enough of them.
+        
+        Each PDF's full text comes back in memory at once, unlike the
+        page-by-page path used for smaller uploads.
+        """
+        if len(paths) < PARALLEL_PARSE_THRESHOLD:
+            return {}
+        loop = asyncio.get_running_loop()
+        pool = get_parse_pool()
+        results = await asyncio.gather(
+            *(loop.run_in_executor(pool, read_pdf_pages, str(path)) for path in paths)
+        )
+        return dict(zip(paths, results))
+
+    async def _index_file(self, path: Path, source: str, pages: Optional[List[str]] = None) -> None:
+        store = vector_manager.get_store(self.tenant_id)
+        # Every chunk carries the file's id so the file can be listed and
+        # deleted as one document
+        file_size = (await asyncio.to_thread(path.stat)).st_size
+        metadata = {
+            "source": source,
+            "tenant_id": self.tenant_id,
+            "file_id": uuid.uuid4().hex,
+            "file_size": file_size,
+        }
+        batch = []
+        # The last chunk of each page is held back and split again with the
+        # next page, so chunk_overlap also applies across page breaks
+        tail = ""
+        async for page in self._extract_pages(path, pages):
+            chunks = _splitter.split_text(f"{tail}\n{page}" if tail else page)
+            tail = chunks.pop() if chunks else tail
+            batch.extend(Document(page_content=c, metadata=dict(metadata)) for c in chunks)
+            if len(batch) >= INGEST_BATCH_SIZE:
+                await store.add_documents(batch)
+                batch = []
+        if tail:
+            batch.append(Document(page_content=tail, metadata=dict(metadata)))
+        if batch:
+            await store.add_documents(batch)
+
     async def process_queue(self) -> None:
         # In this simplified version ingestion happens immediately
         return
 
-    async def _extract_text(self, path: Path) -> str:
-        if path.suffix.lower() == ".pdf":
-            from pypdf import PdfReader
-
-            reader = PdfReader(str(path))
-            return "\n".join(page.extract_text() or "" for page in reader.pages)
-        return path.read_text(encoding="utf-8", errors="ignore")
+    async def _extract_pages(self, path: Path, pages: Optional[List[str]] = None) -> AsyncIterator[str]:
+        if pages is not None:
+            for page in pages:
+                yield page
+            return
+        async for page in _PAGE_EXTRACTORS[path.suffix.lower()](path):
+            yield page
@@ -10,14 +10,16 @@ from fastapi import (
     WebSocket,
 )
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from contextlib import asynccontextmanager
+from datetime import datetime
+import asyncio
 import logging
 from typing import Optional
-import json
+import orjson
 
 from .config import (
-    ALLOWED_ORIGINS, configure_logging, validate_config,
+    ALLOWED_ORIGINS, configure_logging, ensure_dirs, validate_config,
     ENABLE_MULTI_TENANT, ENABLE_ANALYTICS
 )
 from .middleware import (
@@ -29,10 +31,6 @@ from .schemas_enhanced import (
     ChatRequest, ChatResponse, SystemStatus
 )
 from .security_enhanced import get_current_user, User
-from .vector_enhanced import vector_manager
-from .ingest_enhanced import IngestManager
-from .analytics import init_analytics, get_analytics_summary
-from .websocket import websocket_endpoint
 
 # Configure logging
 configure_logging()
@@ -41,9 +39,18 @@ logger = logging.getLogger("chaxai.api")
 # Validate configuration
 validate_config()
 
-# Initialize analytics if enabled
-if ENABLE_ANALYTICS:
-    init_analytics()
+# Heavy modules (FAISS, LangChain, SQLAlchemy) are imported on first use so
+# they stay out of process start-up
+_vector_manager = None
+
+
+def _vm():
+    """Get the vector store manager, importing it on first use."""
+    global _vector_manager
+    if _vector_manager is None:
+        from .vector_enhanced import vector_manager
+        _vector_manager = vector_manager
+    return _vector_manager
 
 
 @asynccontextmanager
@@ -51,15 +58,33 @@ async def lifespan(app: FastAPI):
     """Application lifespan manager."""
     # Startup
     logger.info("Starting ChaxAI Enterprise...")
+    ensure_dirs()
     
     # Preload vector stores for better performance
     if not ENABLE_MULTI_TENANT:
-        await vector_manager.get_store("default").load_store()
+        await _vm().get_store("default").load_store()
+    
+    # Initialize analytics and keep the rollup table fresh
+    rollup_task = None
+    if ENABLE_ANALYTICS:
+        from .analytics import init_analytics, run_rollups
+        init_analytics()
+        rollup_task = asyncio.create_task(run_rollups())
     
     yield
     
     # Shutdown
     logger.info("Shutting down ChaxAI Enterprise...")
+    if rollup_task:
+        rollup_task.cancel()
+    
+    from .pdf_parse import shutdown_parse_pool
+    shutdown_parse_pool()
+    
+    if ENABLE_ANALYTICS:
+        from .analytics import shutdown_analytics
+        # Flush buffered events without blocking the event loop
+        await asyncio.to_thread(shutdown_analytics)
 
 
 # Create FastAPI app
@@ -67,7 +92,8 @@ app = FastAPI(
     title="ChaxAI Enterprise",
     description="Enterprise-grade AI-powered chat system with Grok integration",
     version="2.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
 # Add middleware
@@ -78,13 +104,15 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
-app.add_middleware(RequestIDMiddleware)
 app.add_middleware(SecurityHeadersMiddleware)
 app.add_middleware(RateLimitMiddleware)
 
 if ENABLE_MULTI_TENANT:
     app.add_middleware(TenantMiddleware)
 
+# Added last so it runs first and takes the clock snapshot the others read
+app.add_middleware(RequestIDMiddleware)
+
 
 # Routes
 
@@ -103,10 +131,10 @@ async def root():
     )
 
 
-@app.get("/health")
+@app.get("/health", response_class=ORJSONResponse)
 async def health():
     """Health check endpoint."""
-    return {"status": "healthy", "service": "chaxai-enterprise"}
+    return ORJSONResponse({"status": "healthy", "service": "chaxai-enterprise"})
 
 
 @app.post("/chat", response_model=ChatResponse)
@@ -116,7 +144,7 @@ async def chat(
 ):
     """Chat endpoint with streaming support."""
     try:
-        answer = await vector_manager.ask_question(
+        answer = await _vm().ask_question(
             Question(question=request.message),
             tenant_id=current_user.tenant_id,
             user_id=current_user.user_id
@@ -143,25 +171,16 @@ async def chat_stream(
     
     async def generate():
         try:
-            # This is a simplified version - in production, you'd stream from Grok
-            answer = await vector_manager.ask_question(
+            async for event in _vm().ask_question_stream(
                 Question(question=request.message),
                 tenant_id=current_user.tenant_id,
                 user_id=current_user.user_id
-            )
-            
-            # Simulate streaming by sending chunks
-            words = answer.answer.split()
-            for i in range(0, len(words), 3):
-                chunk = " ".join(words[i:i+3]) + " "
-                yield f"data: {json.dumps({'content': chunk})}\n\n"
-            
-            # Send metadata
-            yield f"data: {json.dumps({'done': True, 'sources': answer.sources})}\n\n"
+            ):
+                yield b"data: " + orjson.dumps(event) + b"\n\n"
             
         except Exception as e:
             logger.error(f"Stream error: {e}")
-            yield f"data: {json.dumps({'error': str(e)})}\n\n"
+            yield b"data: " + orjson.dumps({"error": str(e)}) + b"\n\n"
     
     return StreamingResponse(
         generate(),
@@ -173,21 +192,24 @@ async def chat_stream(
 async def list_documents(
     current_user: User = Depends(get_current_user)
 ):
-    """List documents for the current tenant."""
-    store = vector_manager.get_store(current_user.tenant_id)
-    docs = []
+    """List documents (one entry per uploaded file) for the current tenant."""
+    tenant_id = current_user.tenant_id
+    store = _vm().get_store(tenant_id)
     
-    for doc_id, metadata in store.metadata_store.items():
-        if metadata["metadata"].get("tenant_id") == current_user.tenant_id:
-            docs.append(DocumentInfo(
-                id=doc_id,
-                name=metadata["metadata"].get("source", "Unknown"),
-                size=metadata["metadata"].get("char_count", 0),
-                uploaded_at=metadata["metadata"].get("indexed_at"),
-                metadata=metadata["metadata"]
-            ))
-    
-    return docs
+    # Returned as a response directly so FastAPI skips re-validating the list
+    # against response_model, which is kept for the OpenAPI schema; the
+    # entries are our own metadata, so construction skips validation too
+    return ORJSONResponse([
+        DocumentInfo.model_construct(
+            id=file_id,
+            name=meta.get("source", "Unknown"),
+            size=meta.get("file_size", meta.get("char_count", 0)),
+            uploaded_at=datetime.fromisoformat(meta["indexed_at"]),
+            metadata=meta
+        ).model_dump()
+        for file_id, meta in store.list_files()
+        if meta.get("tenant_id") == tenant_id
+    ])
 
 
 @app.post("/upload", response_model=UploadResponse)
@@ -197,6 +219,8 @@ async def upload_documents(
     current_user: User = Depends(get_current_user)
 ):
     """Upload and process documents."""
+    from .ingest_enhanced import IngestManager
+    
     ingest_manager = IngestManager(current_user.tenant_id)
     
     # Validate files
@@ -228,22 +252,24 @@ async def upload_documents(
 @app.delete("/documents/{document_id}")
 async def delete_document(
     document_id: str,
+    background_tasks: BackgroundTasks,
     current_user: User = Depends(get_current_user)
 ):
-    """Delete a document."""
-    store = vector_manager.get_store(current_user.tenant_id)
+    """Delete a document and all of its chunks."""
+    store = _vm().get_store(current_user.tenant_id)
     
-    if document_id not in store.metadata_store:
+    doc_metadata = store.file_metadata(document_id)
+    if doc_metadata is None:
         raise HTTPException(status_code=404, detail="Document not found")
     
     # Check ownership
-    doc_metadata = store.metadata_store[document_id]
-    if doc_metadata["metadata"].get("tenant_id") != current_user.tenant_id:
+    if doc_metadata.get("tenant_id") != current_user.tenant_id:
         raise HTTPException(status_code=403, detail="Access denied")
     
-    # Remove from metadata store
-    del store.metadata_store[document_id]
-    store._save_metadata()
+    # Remove from metadata store; encrypting and rewriting the store file
+    # runs in the threadpool after the response is sent
+    store.remove_file(document_id)
+    background_tasks.add_task(store._save_metadata)
     
     # Note: Full removal from FAISS requires rebuilding the index
     # In production, you might want to mark as deleted and rebuild periodically
@@ -264,6 +290,8 @@ async def get_analytics(
     if not current_user.is_admin:
         raise HTTPException(status_code=403, detail="Admin access required")
     
+    from .analytics import get_analytics_summary
+    
     summary = await get_analytics_summary(current_user.tenant_id)
     return summary
 
@@ -271,16 +299,18 @@ async def get_analytics(
 @app.websocket("/ws")
 async def websocket_route(websocket: WebSocket):
     """WebSocket endpoint for real-time chat."""
+    from .websocket import websocket_endpoint
+    
     await websocket_endpoint(websocket)
 
 
 # Widget-specific endpoints
 
-@app.get("/widget/config")
+@app.get("/widget/config", response_class=ORJSONResponse)
 async def widget_config(origin: Optional[str] = None):
     """Get widget configuration for the requesting origin."""
     # In production, validate the origin against allowed domains
-    return {
+    return ORJSONResponse({
         "features": {
             "streaming": True,
             "file_upload": True,
@@ -292,7 +322,7 @@ async def widget_config(origin: Optional[str] = None):
             "theme": "light",
             "primary_color": "#1976d2"
         }
-    }
+    })
 
 
 if __name__ == "__main__":
@@ -1,15 +1,18 @@
 """Enhanced middleware for enterprise features."""
 
+import itertools
+import secrets
 import time
-import uuid
 import logging
-from typing import Dict, Optional
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
 from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.requests import Request
 from starlette.responses import Response
 from fastapi import status
-import redis
-from datetime import datetime, timedelta
+import orjson
+import redis.asyncio as aioredis
+from datetime import datetime, timedelta, timezone
 
 from .config import (
     RATE_LIMIT_REQUESTS, RATE_LIMIT_WINDOW,
@@ -18,17 +21,38 @@ from .config import (
 
 logger = logging.getLogger("chaxai.middleware")
 
+# Paths that bypass rate limiting and tenant resolution
+_SKIP_PATHS = frozenset({"/health", "/", "/docs", "/openapi.json"})
+
+# Request IDs are a per-process random prefix plus a counter, which is unique
+# across workers without a urandom read per request
+_REQUEST_ID_PREFIX = secrets.token_hex(4)
+_request_counter = itertools.count()
+
+
+def _request_clock(request: Request) -> Tuple[float, float]:
+    """Return the (wall, monotonic) request start set by RequestIDMiddleware."""
+    t_wall = getattr(request.state, "t_wall", None)
+    if t_wall is None:
+        return time.time(), time.monotonic()
+    return t_wall, request.state.t_mono
+
 
 class RequestIDMiddleware(BaseHTTPMiddleware):
     """Attach unique request ID to each request."""
     
     async def dispatch(self, request: Request, call_next) -> Response:
-        request_id = request.headers.get("X-Request-ID", str(uuid.uuid4()))
+        request_id = (
+            request.headers.get("x-request-id")
+            or f"{_REQUEST_ID_PREFIX}-{next(_request_counter):x}"
+        )
         request.state.request_id = request_id
         
-        start_time = time.time()
+        # Single clock snapshot shared with the inner middleware
+        request.state.t_wall = time.time()
+        request.state.t_mono = start = time.monotonic()
         response = await call_next(request)
-        process_time = time.time() - start_time
+        process_time = time.monotonic() - start
         
         response.headers["X-Request-ID"] = request_id
         response.headers["X-Process-Time"] = str(process_time)
@@ -45,57 +69,89 @@ class RequestIDMiddleware(BaseHTTPMiddleware):
 class SecurityHeadersMiddleware(BaseHTTPMiddleware):
     """Add comprehensive security headers."""
     
+    _HEADERS = (
+        ("x-content-type-options", "nosniff"),
+        ("x-frame-options", "DENY"),
+        ("x-xss-protection", "1; mode=block"),
+        ("referrer-policy", "strict-origin-when-cross-origin"),
+        ("content-security-policy", (
+            "default-src 'self'; "
+            "script-src 'self' 'unsafe-inline' 'unsafe-eval'; "
+            "style-src 'self' 'unsafe-inline'; "
+            "img-src 'self' data: https:; "
+            "font-src 'self' data:; "
+            "connect-src 'self' https: wss:;"
+        )),
+        ("permissions-policy", (
+            "camera=(), microphone=(), geolocation=(), "
+            "interest-cohort=()"
+        )),
+        ("strict-transport-security", "max-age=31536000; includeSubDomains"),
+    )
+    
+    # Encoded once so each response just extends its raw header list
+    _ENCODED_HEADERS = [
+        (k.encode("latin-1"), v.encode("latin-1")) for k, v in _HEADERS
+    ]
+    
     async def dispatch(self, request: Request, call_next) -> Response:
         response = await call_next(request)
-        
-        security_headers = {
-            "X-Content-Type-Options": "nosniff",
-            "X-Frame-Options": "DENY",
-            "X-XSS-Protection": "1; mode=block",
-            "Referrer-Policy": "strict-origin-when-cross-origin",
-            "Content-Security-Policy": (
-                "default-src 'self'; "
-                "script-src 'self' 'unsafe-inline' 'unsafe-eval'; "
-                "style-src 'self' 'unsafe-inline'; "
-                "img-src 'self' data: https:; "
-                "font-src 'self' data:; "
-                "connect-src 'self' https: wss:;"
-            ),
-            "Permissions-Policy": (
-                "camera=(), microphone=(), geolocation=(), "
-                "interest-cohort=()"
-            ),
-            "Strict-Transport-Security": "max-age=31536000; includeSubDomains",
-        }
-        
-        for header, value in security_headers.items():
-            response.headers[header] = value
-        
+        # Leave headers the endpoint set itself untouched
+        existing = {k for k, _ in response.raw_headers}
+        response.raw_headers.extend(
+            h for h in self._ENCODED_HEADERS if h[0] not in existing
+        )
         return response
 
 
+# Atomically increment a counter and start its window on first use
+_INCR_WITH_EXPIRY = """
+local current = redis.call('INCR', KEYS[1])
+if current == 1 then
+    redis.call('EXPIRE', KEYS[1], ARGV[1])
+end
+return current
+"""
+
+
+# Seconds between Redis health probes; rate limiting is skipped while down
+REDIS_RECHECK_INTERVAL = 30
+
+
 class RateLimitMiddleware(BaseHTTPMiddleware):
     """Rate limiting middleware using Redis."""
     
     def __init__(self, app):
         super().__init__(app)
-        self.redis_client = None
-        try:
-            self.redis_client = redis.Redis(
-                host='redis',
-                port=6379,
-                decode_responses=True
-            )
-            self.redis_client.ping()
-        except Exception as e:
-            logger.warning(f"Redis not available for rate limiting: {e}")
+        self.redis_client = aioredis.Redis(
+            host='redis',
+            port=6379,
+            decode_responses=True
+        )
+        self._incr_script = self.redis_client.register_script(_INCR_WITH_EXPIRY)
+        self._healthy: Optional[bool] = None
+        self._last_check = 0.0
+    
+    async def _redis_available(self) -> bool:
+        """Return cached Redis health, re-probing every REDIS_RECHECK_INTERVAL."""
+        now = time.monotonic()
+        if self._healthy is None or now - self._last_check > REDIS_RECHECK_INTERVAL:
+            self._last_check = now
+            try:
+                await self.redis_client.ping()
+                self._healthy = True
+            except Exception as e:
+                if self._healthy is not False:
+                    logger.warning(f"Redis not available for rate limiting: {e}")
+                self._healthy = False
+        return self._healthy
     
     async def dispatch(self, request: Request, call_next) -> Response:
-        if not self.redis_client:
+        # Skip rate limiting for health checks
+        if request.url.path in _SKIP_PATHS:
             return await call_next(request)
         
-        # Skip rate limiting for health checks
-        if request.url.path in ["/health", "/", "/docs", "/openapi.json"]:
+        if not await self._redis_available():
             return await call_next(request)
         
         # Get client identifier
@@ -103,53 +159,60 @@ class RateLimitMiddleware(BaseHTTPMiddleware):
         key = f"rate_limit:{client_id}"
         
         try:
-            # Check rate limit
-            current = self.redis_client.incr(key)
-            if current == 1:
-                self.redis_client.expire(key, RATE_LIMIT_WINDOW)
-            
-            if current > RATE_LIMIT_REQUESTS:
-                logger.warning(f"Rate limit exceeded for {client_id}")
-                return Response(
-                    content="Rate limit exceeded",
-                    status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-                    headers={
-                        "Retry-After": str(RATE_LIMIT_WINDOW),
-                        "X-RateLimit-Limit": str(RATE_LIMIT_REQUESTS),
-                        "X-RateLimit-Remaining": "0",
-                        "X-RateLimit-Reset": str(
-                            int(time.time()) + RATE_LIMIT_WINDOW
-                        ),
-                    }
-                )
-            
-            # Process request
-            response = await call_next(request)
-            
-            # Add rate limit headers
-            remaining = max(0, RATE_LIMIT_REQUESTS - current)
-            response.headers["X-RateLimit-Limit"] = str(RATE_LIMIT_REQUESTS)
-            response.headers["X-RateLimit-Remaining"] = str(remaining)
-            response.headers["X-RateLimit-Reset"] = str(
-                int(time.time()) + RATE_LIMIT_WINDOW
-            )
-            
-            return response
-            
+            # Check rate limit (single round trip)
+            current = await self._incr_script(keys=[key], args=[RATE_LIMIT_WINDOW])
         except Exception as e:
             logger.error(f"Rate limiting error: {e}")
             return await call_next(request)
+        
+        reset = str(int(_request_clock(request)[0]) + RATE_LIMIT_WINDOW)
+        
+        if current > RATE_LIMIT_REQUESTS:
+            logger.warning(f"Rate limit exceeded for {client_id}")
+            return Response(
+                content="Rate limit exceeded",
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                headers={
+                    "Retry-After": str(RATE_LIMIT_WINDOW),
+                    "X-RateLimit-Limit": str(RATE_LIMIT_REQUESTS),
+                    "X-RateLimit-Remaining": "0",
+                    "X-RateLimit-Reset": reset,
+                }
+            )
+        
+        # Process request
+        response = await call_next(request)
+        
+        # Add rate limit headers
+        remaining = max(0, RATE_LIMIT_REQUESTS - current)
+        response.headers["X-RateLimit-Limit"] = str(RATE_LIMIT_REQUESTS)
+        response.headers["X-RateLimit-Remaining"] = str(remaining)
+        response.headers["X-RateLimit-Reset"] = reset
+        
+        return response
+
+
+@lru_cache(maxsize=1024)
+def _tenant_from_host(host: str) -> Optional[str]:
+    """Derive a tenant ID from the subdomain of a Host header."""
+    if "." not in host:
+        return None
+    subdomain = host.partition(".")[0]
+    if subdomain in ("www", "api"):
+        return None
+    return subdomain
 
 
 class TenantMiddleware(BaseHTTPMiddleware):
     """Multi-tenant isolation middleware."""
     
     async def dispatch(self, request: Request, call_next) -> Response:
-        # Extract tenant ID from various sources
-        tenant_id = None
+        if request.url.path in _SKIP_PATHS:
+            return await call_next(request)
         
+        # Extract tenant ID from various sources
         # 1. From header
-        tenant_id = request.headers.get("X-Tenant-ID")
+        tenant_id = request.headers.get("x-tenant-id")
         
         # 2. From JWT token (if authenticated)
         if not tenant_id and hasattr(request.state, "user"):
@@ -157,11 +220,7 @@ class TenantMiddleware(BaseHTTPMiddleware):
         
         # 3. From subdomain
         if not tenant_id:
-            host = request.headers.get("host", "")
-            if "." in host:
-                subdomain = host.split(".")[0]
-                if subdomain not in ["www", "api"]:
-                    tenant_id = subdomain
+            tenant_id = _tenant_from_host(request.headers.get("host", ""))
         
         # 4. Default tenant
         if not tenant_id:
@@ -183,11 +242,15 @@ class AuditMiddleware(BaseHTTPMiddleware):
     """Audit logging middleware for compliance."""
     
     async def dispatch(self, request: Request, call_next) -> Response:
+        if request.url.path in _SKIP_PATHS:
+            return await call_next(request)
+        
         audit_logger = logging.getLogger("chaxai.audit")
+        t_wall, t_mono = _request_clock(request)
         
         # Capture request details
         audit_entry = {
-            "timestamp": datetime.utcnow().isoformat(),
+            "timestamp": datetime.fromtimestamp(t_wall, tz=timezone.utc).isoformat(),
             "request_id": getattr(request.state, "request_id", "unknown"),
             "method": request.method,
             "path": request.url.path,
@@ -202,9 +265,8 @@ class AuditMiddleware(BaseHTTPMiddleware):
             audit_entry["user_email"] = request.state.user.email
         
         # Process request
-        start_time = time.time()
         response = await call_next(request)
-        duration = time.time() - start_time
+        duration = time.monotonic() - t_mono
         
         # Complete audit entry
         audit_entry.update({
@@ -214,6 +276,6 @@ class AuditMiddleware(BaseHTTPMiddleware):
         })
         
         # Log audit entry
-        audit_logger.info(json.dumps(audit_entry))
+        audit_logger.info(orjson.dumps(audit_entry).decode())
         
         return response
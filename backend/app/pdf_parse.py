@@ -0,0 +1,39 @@
+"""PDF text extraction in a small pool of spawned worker processes.
+
+Kept free of app imports so spawned workers only load pypdf.
+"""
+
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
+
+# Per app process; gunicorn runs several app processes
+PARSE_POOL_WORKERS = 2
+
+_parse_pool: Optional[ProcessPoolExecutor] = None
+
+
+def read_pdf_pages(path: str) -> List[str]:
+    """Extract the text of every page of a PDF (runs in a worker process)."""
+    from pypdf import PdfReader
+
+    return [page.extract_text() or "" for page in PdfReader(path).pages]
+
+
+def get_parse_pool() -> ProcessPoolExecutor:
+    # spawn rather than fork: the parent is multithreaded (analytics writer,
+    # to_thread workers) and a forked child can inherit a held lock
+    global _parse_pool
+    if _parse_pool is None:
+        _parse_pool = ProcessPoolExecutor(
+            max_workers=PARSE_POOL_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _parse_pool
+
+
+def shutdown_parse_pool() -> None:
+    global _parse_pool
+    if _parse_pool is not None:
+        _parse_pool.shutdown(wait=False, cancel_futures=True)
+        _parse_pool = None
@@ -1,16 +1,19 @@
 """Enhanced security module with JWT and multi-tenant support."""
 
+import asyncio
+import time
 import jwt
 import bcrypt
 from datetime import datetime, timedelta
+from functools import lru_cache
 from typing import Optional, List
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from pydantic import BaseModel
+from pydantic import BaseModel, ValidationError
 import logging
 
 from .config import (
-    JWT_SECRET_KEY, JWT_ALGORITHM, JWT_EXPIRATION_HOURS,
+    JWT_SECRET_KEY, JWT_ALGORITHM, JWT_EXPIRATION_HOURS, BCRYPT_ROUNDS,
     API_TOKENS, get_encryption_cipher
 )
 
@@ -18,6 +21,12 @@ logger = logging.getLogger("chaxai.security")
 
 security = HTTPBearer(auto_error=False)
 
+# Decoded-token cache size; only signature verification is cached
+JWT_DECODE_CACHE_SIZE = 8192
+
+# O(1) API token lookup instead of scanning the configured list
+_API_TOKEN_SET = frozenset(API_TOKENS)
+
 
 class User(BaseModel):
     user_id: str
@@ -52,15 +61,37 @@ def create_access_token(user: User) -> str:
     return token
 
 
+@lru_cache(maxsize=JWT_DECODE_CACHE_SIZE)
+def _decode_token(token: str) -> dict:
+    """Verify a token's signature and decode its claims (cached).
+    
+    Expiry is not checked here so cached results never outlive the token;
+    verify_token re-checks exp on every call. Failures raise and are not cached.
+    """
+    return jwt.decode(
+        token,
+        JWT_SECRET_KEY,
+        algorithms=[JWT_ALGORITHM],
+        options={"verify_exp": False}
+    )
+
+
 def verify_token(token: str) -> Optional[User]:
     """Verify and decode a JWT token."""
     try:
-        payload = jwt.decode(
-            token,
-            JWT_SECRET_KEY,
-            algorithms=[JWT_ALGORITHM]
-        )
+        payload = _decode_token(token)
         
+        # jwt.decode skips its own exp checks when verify_exp is off,
+        # including the type check
+        exp = payload.get("exp")
+        if exp is not None:
+            if isinstance(exp, bool) or not isinstance(exp, (int, float)):
+                raise jwt.InvalidTokenError("Expiration Time claim (exp) must be a number")
+            if exp <= time.time():
+                raise jwt.ExpiredSignatureError("Signature has expired")
+        
+        # Claims are untrusted input even with a valid signature, so the
+        # principal is validated (this also copies the cached permissions)
         user = User(
             user_id=payload["sub"],
             tenant_id=payload["tenant_id"],
@@ -77,6 +108,9 @@ def verify_token(token: str) -> Optional[User]:
     except jwt.InvalidTokenError as e:
         logger.warning(f"Invalid token: {e}")
         return None
+    except ValidationError as e:
+        logger.warning(f"Invalid token claims: {e}")
+        return None
 
 
 async def get_current_user(
@@ -92,7 +126,7 @@ async def get_current_user(
         # This is a simplified check - in production, inject Request properly
         api_token = None  # Get from request headers
         
-        if api_token and api_token in API_TOKENS:
+        if api_token and api_token in _API_TOKEN_SET:
             # API token authentication
             return User(
                 user_id="api_user",
@@ -119,21 +153,29 @@ async def get_current_user(
     return user
 
 
-def hash_password(password: str) -> str:
-    """Hash a password using bcrypt."""
-    salt = bcrypt.gensalt()
+def _sync_hash(password: str, rounds: int) -> str:
+    salt = bcrypt.gensalt(rounds)
     hashed = bcrypt.hashpw(password.encode('utf-8'), salt)
     return hashed.decode('utf-8')
 
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """Verify a password against its hash."""
+def _sync_check(plain_password: str, hashed_password: str) -> bool:
     return bcrypt.checkpw(
         plain_password.encode('utf-8'),
         hashed_password.encode('utf-8')
     )
 
 
+async def hash_password(password: str) -> str:
+    """Hash a password using bcrypt in a worker thread."""
+    return await asyncio.to_thread(_sync_hash, password, BCRYPT_ROUNDS)
+
+
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    """Verify a password against its hash in a worker thread."""
+    return await asyncio.to_thread(_sync_check, plain_password, hashed_password)
+
+
 def encrypt_sensitive_data(data: str) -> str:
     """Encrypt sensitive data."""
     cipher = get_encryption_cipher()
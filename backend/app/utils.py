@@ -1,17 +1,26 @@
 from __future__ import annotations
 
-import re
+import string
 from pathlib import Path
 
 __all__ = ["secure_filename"]
 
-_invalid_re = re.compile(r"[^A-Za-z0-9_.-]")
+_ALLOWED = frozenset(string.ascii_letters + string.digits + "_.-")
+
+
+class _SanitizeTable(dict):
+    """str.translate table: allowed characters map to themselves, all others to "_"."""
+
+    def __missing__(self, key: int) -> str:
+        return "_"
+
+
+_TRANS = _SanitizeTable({ord(c): ord(c) for c in _ALLOWED})
 
 
 def secure_filename(filename: str) -> str:
     """Return a secure version of the given filename."""
-    name = Path(filename).name
-    name = _invalid_re.sub("_", name)
+    name = Path(filename).name.translate(_TRANS)
     if not name:
         raise ValueError("Invalid filename")
     return name
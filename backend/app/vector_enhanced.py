@@ -1,13 +1,18 @@
 """Enhanced vector store with Grok integration and advanced RAG."""
 
+import hashlib
 import os
-import json
+import re
+import threading
+import orjson
 import logging
-from typing import List, Dict, Optional, Any, Tuple
+from typing import AsyncIterator, List, Dict, Optional, Any, Tuple
 from datetime import datetime
 import asyncio
 from functools import lru_cache
 from pathlib import Path
+import numpy as np
+from cachetools import TTLCache
 from langchain.docstore.document import Document
 from langchain_openai import OpenAIEmbeddings
 from langchain_community.vectorstores import FAISS
@@ -15,13 +20,49 @@ from langchain.text_splitter import RecursiveCharacterTextSplitter
 
 from .config import (
     VECTOR_DIR, CACHE_DIR, EMBEDDING_MODEL,
-    OPENAI_API_KEY, get_encryption_cipher
+    OPENAI_API_KEY, GROK_STREAMING, get_encryption_cipher
 )
 from .grok_client import get_grok_client
 from .schemas_enhanced import Question, Answer, DocumentInfo
 
 logger = logging.getLogger("chaxai.vector")
 
+# Grok rerank prompt pieces, built once
+_RERANK_SYSTEM = {
+    "role": "system",
+    "content": "You are a search result reranker. Given a query and passages, rank them by relevance. Return only the passage numbers in order of relevance, separated by commas."
+}
+_PASSAGE_FMT = "Passage {i}: {content}...".format
+_RANK_NUMBER_RE = re.compile(r"\d+")
+
+# Recent rerank orderings per store, keyed by query and passage digests
+RERANK_CACHE_SIZE = 1024
+RERANK_CACHE_TTL = 60
+
+
+@lru_cache(maxsize=1)
+def get_embeddings() -> OpenAIEmbeddings:
+    """Get the embedding model shared by all tenant stores (cached)."""
+    return OpenAIEmbeddings(
+        openai_api_key=OPENAI_API_KEY,
+        model=EMBEDDING_MODEL,
+        request_timeout=60,
+        max_retries=3
+    )
+
+
+def _digest(text: str) -> bytes:
+    """Short stable digest used in cache keys."""
+    return hashlib.blake2b(text.encode(), digest_size=8).digest()
+
+
+# Bounded so memory does not grow with the corpus; comfortably holds the
+# candidates of recent queries
+@lru_cache(maxsize=4096)
+def _content_tokens(text: str) -> frozenset:
+    """Lowercased token set for a chunk of text (cached by content)."""
+    return frozenset(text.lower().split())
+
 
 class EnhancedVectorStore:
     """Advanced vector store with caching and metadata."""
@@ -30,19 +71,17 @@ class EnhancedVectorStore:
         self.tenant_id = tenant_id
         self.vector_dir = Path(VECTOR_DIR) / tenant_id
         self.cache_dir = Path(CACHE_DIR) / tenant_id
-        self.embeddings = self._get_embeddings()
+        self.embeddings = get_embeddings()
         self.store = None
         self.metadata_store = {}
+        # Chunk doc_ids per uploaded file; entries without a file_id (indexed
+        # before files were chunked) are their own file
+        self._files: Dict[str, List[str]] = {}
+        # Metadata is saved from the event loop and from background tasks
+        self._save_lock = threading.Lock()
+        self._rerank_cache: TTLCache = TTLCache(maxsize=RERANK_CACHE_SIZE, ttl=RERANK_CACHE_TTL)
         self._load_metadata()
     
-    @lru_cache(maxsize=1)
-    def _get_embeddings(self):
-        """Get embedding model (cached)."""
-        return OpenAIEmbeddings(
-            openai_api_key=OPENAI_API_KEY,
-            model=EMBEDDING_MODEL
-        )
-    
     def _load_metadata(self):
         """Load document metadata from encrypted store."""
         metadata_file = self.vector_dir / "metadata.enc"
@@ -51,17 +90,47 @@ class EnhancedVectorStore:
             with open(metadata_file, "rb") as f:
                 encrypted_data = f.read()
             decrypted_data = cipher.decrypt(encrypted_data)
-            self.metadata_store = json.loads(decrypted_data)
+            self.metadata_store = orjson.loads(decrypted_data)
+            for doc_id, entry in self.metadata_store.items():
+                self._index_chunk(doc_id, entry["metadata"])
+    
+    def _index_chunk(self, doc_id: str, meta: Dict[str, Any]):
+        self._files.setdefault(meta.get("file_id") or doc_id, []).append(doc_id)
+    
+    def list_files(self) -> List[Tuple[str, Dict[str, Any]]]:
+        """(file_id, metadata of its first chunk) for every indexed file."""
+        return [
+            (file_id, self.metadata_store[doc_ids[0]]["metadata"])
+            for file_id, doc_ids in self._files.items()
+        ]
+    
+    def file_metadata(self, file_id: str) -> Optional[Dict[str, Any]]:
+        """Metadata of a file's first chunk, or None if it is unknown."""
+        doc_ids = self._files.get(file_id)
+        return self.metadata_store[doc_ids[0]]["metadata"] if doc_ids else None
+    
+    def remove_file(self, file_id: str):
+        """Drop the metadata of every chunk of a file; the caller persists the store."""
+        for doc_id in self._files.pop(file_id):
+            del self.metadata_store[doc_id]
     
     def _save_metadata(self):
-        """Save document metadata to encrypted store."""
+        """Save document metadata to encrypted store.
+        
+        Writers are serialized and the file is replaced atomically, so a
+        reader never sees a partially written token.
+        """
         self.vector_dir.mkdir(parents=True, exist_ok=True)
         metadata_file = self.vector_dir / "metadata.enc"
+        tmp_file = self.vector_dir / f"metadata.enc.{os.getpid()}.tmp"
         cipher = get_encryption_cipher()
-        data = json.dumps(self.metadata_store).encode()
-        encrypted_data = cipher.encrypt(data)
-        with open(metadata_file, "wb") as f:
-            f.write(encrypted_data)
+        with self._save_lock:
+            # OPT_NON_STR_KEYS keeps json.dumps' coercion of non-string keys
+            data = orjson.dumps(self.metadata_store, option=orjson.OPT_NON_STR_KEYS)
+            encrypted_data = cipher.encrypt(data)
+            with open(tmp_file, "wb") as f:
+                f.write(encrypted_data)
+            os.replace(tmp_file, metadata_file)
     
     async def load_store(self):
         """Load or create vector store."""
@@ -88,15 +157,21 @@ class EnhancedVectorStore:
         """Add documents with enhanced metadata."""
         await self.load_store()
         
+        # One timestamp per batch; content digest is stable across processes
+        now_iso = datetime.utcnow().isoformat()
+        
         # Enhance documents with metadata
-        for doc in documents:
-            doc_id = f"{self.tenant_id}_{datetime.utcnow().isoformat()}_{hash(doc.page_content)}"
+        for i, doc in enumerate(documents):
+            # The batch index keeps identical chunks (e.g. repeated
+            # boilerplate pages) from sharing an id
+            digest = hashlib.blake2b(doc.page_content.encode(), digest_size=8).hexdigest()
+            doc_id = f"{self.tenant_id}_{now_iso}_{i}_{digest}"
             
             # Extract additional metadata
             doc.metadata.update({
                 "tenant_id": self.tenant_id,
                 "doc_id": doc_id,
-                "indexed_at": datetime.utcnow().isoformat(),
+                "indexed_at": now_iso,
                 "char_count": len(doc.page_content),
                 "word_count": len(doc.page_content.split()),
             })
@@ -104,6 +179,9 @@ class EnhancedVectorStore:
             if metadata:
                 doc.metadata.update(metadata)
             
+            if doc_id not in self.metadata_store:
+                self._index_chunk(doc_id, doc.metadata)
+            
             # Store extended metadata
             self.metadata_store[doc_id] = {
                 "content_preview": doc.page_content[:200],
@@ -111,8 +189,14 @@ class EnhancedVectorStore:
                 "embeddings_model": EMBEDDING_MODEL,
             }
         
-        # Add to vector store
-        self.store.add_documents(documents)
+        # Embed the whole batch in one call off the event loop, then add the
+        # precomputed vectors to the index
+        texts = [doc.page_content for doc in documents]
+        vectors = await asyncio.to_thread(self.embeddings.embed_documents, texts)
+        self.store.add_embeddings(
+            list(zip(texts, vectors)),
+            metadatas=[doc.metadata for doc in documents]
+        )
         
         # Save everything
         self.store.save_local(str(self.vector_dir))
@@ -125,56 +209,78 @@ class EnhancedVectorStore:
         query: str,
         k: int = 4,
         rerank: bool = True
-    ) -> List[Tuple[Document, float]]:
-        """Hybrid search with semantic and keyword matching."""
+    ) -> Tuple[List[Document], np.ndarray]:
+        """Hybrid search with semantic and keyword matching.
+        
+        Returns the top documents and their combined scores, in rank order.
+        """
         await self.load_store()
         
         # Semantic search
         semantic_results = self.store.similarity_search_with_score(query, k=k*2)
         
+        if not semantic_results:
+            return [], np.empty(0, dtype=np.float32)
+        
         # Keyword search (simple BM25-like scoring)
-        query_terms = set(query.lower().split())
-        keyword_scores = []
+        query_terms = frozenset(query.lower().split())
+        n = len(semantic_results)
+        docs = [doc for doc, _ in semantic_results]
+        semantic_scores = np.fromiter(
+            (score for _, score in semantic_results), dtype=np.float32, count=n
+        )
+        overlap = np.fromiter(
+            (len(query_terms & _content_tokens(doc.page_content)) for doc in docs),
+            dtype=np.int32, count=n
+        )
         
-        for doc, semantic_score in semantic_results:
-            content_terms = set(doc.page_content.lower().split())
-            keyword_score = len(query_terms.intersection(content_terms)) / len(query_terms)
-            
-            # Combine scores (weighted)
-            combined_score = 0.7 * (1 - semantic_score) + 0.3 * keyword_score
-            keyword_scores.append((doc, combined_score))
+        # Combine scores (weighted)
+        combined = 0.7 * (1 - semantic_scores) + 0.3 * (overlap / max(len(query_terms), 1))
         
-        # Sort by combined score
-        keyword_scores.sort(key=lambda x: x[1], reverse=True)
+        # Order by combined score; without reranking only the top k are needed
+        if not rerank and k < n:
+            top = np.argpartition(-combined, k)[:k]
+            order = top[np.argsort(-combined[top], kind="stable")]
+        else:
+            order = np.argsort(-combined, kind="stable")
         
         # Rerank using Grok if enabled
-        if rerank and len(keyword_scores) > 0:
-            reranked = await self._rerank_with_grok(query, keyword_scores[:k*2])
-            return reranked[:k]
+        if rerank:
+            permutation = await self._rerank_with_grok(query, [docs[i] for i in order])
+            order = order[permutation]
         
-        return keyword_scores[:k]
+        order = order[:k]
+        return [docs[i] for i in order], combined[order]
     
     async def _rerank_with_grok(
         self,
         query: str,
-        results: List[Tuple[Document, float]]
-    ) -> List[Tuple[Document, float]]:
-        """Rerank results using Grok for better relevance."""
+        docs: List[Document]
+    ) -> List[int]:
+        """Rerank documents using Grok; returns a permutation of their indices."""
+        # The same candidates for the same query get the cached ordering
+        contents = [doc.page_content[:500] for doc in docs]
+        cache_key = (
+            _digest(query),
+            tuple(_digest(content) for content in contents)
+        )
+        cached = self._rerank_cache.get(cache_key)
+        if cached is not None:
+            return list(cached)
+        
         client = get_grok_client()
         
         # Prepare reranking prompt
-        passages = []
-        for i, (doc, score) in enumerate(results):
-            passages.append(f"Passage {i+1}: {doc.page_content[:500]}...")
+        passages = "\n\n".join(
+            _PASSAGE_FMT(i=i, content=content)
+            for i, content in enumerate(contents, 1)
+        )
         
         messages = [
-            {
-                "role": "system",
-                "content": "You are a search result reranker. Given a query and passages, rank them by relevance. Return only the passage numbers in order of relevance, separated by commas."
-            },
+            _RERANK_SYSTEM,
             {
                 "role": "user",
-                "content": f"Query: {query}\n\n" + "\n\n".join(passages) + "\n\nRank the passages by relevance (most relevant first):"
+                "content": f"Query: {query}\n\n{passages}\n\nRank the passages by relevance (most relevant first):"
             }
         ]
         
@@ -188,24 +294,63 @@ class EnhancedVectorStore:
             
             # Parse ranking
             ranking_text = response["choices"][0]["message"]["content"]
-            rankings = [int(x.strip()) - 1 for x in ranking_text.split(",") if x.strip().isdigit()]
+            rankings = [int(x) - 1 for x in _RANK_NUMBER_RE.findall(ranking_text)]
             
-            # Reorder results
+            # Reorder results, ignoring out-of-range and repeated numbers
+            seen = set()
             reranked = []
             for idx in rankings:
-                if 0 <= idx < len(results):
-                    reranked.append(results[idx])
+                if 0 <= idx < len(docs) and idx not in seen:
+                    seen.add(idx)
+                    reranked.append(idx)
             
             # Add any missing results
-            for i, result in enumerate(results):
-                if i not in rankings:
-                    reranked.append(result)
+            reranked.extend(i for i in range(len(docs)) if i not in seen)
             
+            self._rerank_cache[cache_key] = tuple(reranked)
             return reranked
             
         except Exception as e:
             logger.error(f"Reranking failed: {e}")
-            return results
+            return list(range(len(docs)))
+
+
+def _build_prompt(
+    question: Question,
+    docs: List[Document],
+    scores: np.ndarray
+) -> Tuple[List[Dict[str, str]], List[Dict[str, Any]]]:
+    """Build the Grok messages and source details for a RAG answer."""
+    context_parts = []
+    sources = []
+    
+    for doc, score in zip(docs, scores.tolist()):
+        context_parts.append(f"[Source: {doc.metadata.get('source', 'Unknown')}]\n{doc.page_content}")
+        sources.append({
+            "source": doc.metadata.get("source", "Unknown"),
+            "score": score,
+            "preview": doc.page_content[:100] + "..."
+        })
+    
+    context = "\n\n---\n\n".join(context_parts)
+    
+    messages = [
+        {
+            "role": "system",
+            "content": (
+                "You are ChaxAI, an enterprise-grade AI assistant. "
+                "Answer questions based on the provided context. "
+                "Be accurate, helpful, and cite your sources when possible. "
+                "If you're not sure about something, say so."
+            )
+        },
+        {
+            "role": "user",
+            "content": f"Context:\n{context}\n\nQuestion: {question.question}"
+        }
+    ]
+    
+    return messages, sources
 
 
 class VectorStoreManager:
@@ -227,48 +372,20 @@ class VectorStoreManager:
         user_id: Optional[str] = None
     ) -> Answer:
         """Ask a question using Grok with RAG."""
+        # Answers are built from our own data, so validation is skipped
         store = self.get_store(tenant_id)
         
         # Search for relevant documents
-        results = await store.hybrid_search(question.question, k=4)
+        docs, scores = await store.hybrid_search(question.question, k=4)
         
-        if not results:
-            return Answer(
+        if not docs:
+            return Answer.model_construct(
                 answer="I couldn't find any relevant information in the knowledge base.",
                 sources=[],
                 confidence=0.0
             )
         
-        # Prepare context
-        context_parts = []
-        sources = []
-        
-        for doc, score in results:
-            context_parts.append(f"[Source: {doc.metadata.get('source', 'Unknown')}]\n{doc.page_content}")
-            sources.append({
-                "source": doc.metadata.get("source", "Unknown"),
-                "score": float(score),
-                "preview": doc.page_content[:100] + "..."
-            })
-        
-        context = "\n\n---\n\n".join(context_parts)
-        
-        # Build messages for Grok
-        messages = [
-            {
-                "role": "system",
-                "content": (
-                    "You are ChaxAI, an enterprise-grade AI assistant. "
-                    "Answer questions based on the provided context. "
-                    "Be accurate, helpful, and cite your sources when possible. "
-                    "If you're not sure about something, say so."
-                )
-            },
-            {
-                "role": "user",
-                "content": f"Context:\n{context}\n\nQuestion: {question.question}"
-            }
-        ]
+        messages, sources = _build_prompt(question, docs, scores)
         
         # Get answer from Grok
         client = get_grok_client()
@@ -301,10 +418,11 @@ class VectorStoreManager:
                 answer_text = response["choices"][0]["message"]["content"]
             
             # Calculate confidence based on source scores
-            avg_score = sum(score for _, score in results) / len(results)
-            confidence = min(avg_score * 100, 100)
+            # (clipped to the 0-100 range Answer declares, since
+            # model_construct does not enforce it)
+            confidence = float(np.clip(scores.mean() * 100, 0.0, 100.0))
             
-            return Answer(
+            return Answer.model_construct(
                 answer=answer_text,
                 sources=[s["source"] for s in sources],
                 source_details=sources,
@@ -314,12 +432,47 @@ class VectorStoreManager:
             
         except Exception as e:
             logger.error(f"Error getting answer from Grok: {e}")
-            return Answer(
+            return Answer.model_construct(
                 answer="I encountered an error while processing your question. Please try again.",
                 sources=[],
                 confidence=0.0
             )
 
+    
+    async def ask_question_stream(
+        self,
+        question: Question,
+        tenant_id: str = "default",
+        user_id: Optional[str] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Ask a question and yield answer events as Grok streams them.
+        
+        Yields ``{"content": delta}`` for each chunk, then a final
+        ``{"done": True, "sources": [...]}`` event.
+        """
+        store = self.get_store(tenant_id)
+        docs, scores = await store.hybrid_search(question.question, k=4)
+        
+        if not docs:
+            yield {"content": "I couldn't find any relevant information in the knowledge base."}
+            yield {"done": True, "sources": []}
+            return
+        
+        messages, sources = _build_prompt(question, docs, scores)
+        client = get_grok_client()
+        
+        async for chunk in await client.create_chat_completion(
+            messages=messages,
+            stream=True,
+            metadata={
+                "tenant_id": tenant_id,
+                "user_id": user_id
+            }
+        ):
+            yield {"content": chunk}
+        
+        yield {"done": True, "sources": [s["source"] for s in sources]}
+
 
 # Global manager instance
 vector_manager = VectorStoreManager()
@@ -1,6 +1,6 @@
 """WebSocket support for real-time communication."""
 
-import json
+import orjson
 import logging
 from typing import Dict, Set
 from fastapi import WebSocket, WebSocketDisconnect
@@ -51,9 +51,21 @@ class ConnectionManager:
     
     async def broadcast_to_tenant(self, tenant_id: str, message: dict):
         """Broadcast message to all connections in a tenant."""
-        if tenant_id in self.active_connections:
-            for connection in self.active_connections[tenant_id]:
-                await connection.send_json(message)
+        connections = self.active_connections.get(tenant_id)
+        if not connections:
+            return
+        
+        # Serialize once and send concurrently; copy the set since clients
+        # may disconnect while the sends are in flight
+        text = orjson.dumps(message).decode()
+        targets = list(connections)
+        results = await asyncio.gather(
+            *(connection.send_text(text) for connection in targets),
+            return_exceptions=True
+        )
+        for result in results:
+            if isinstance(result, Exception):
+                logger.warning(f"Broadcast to tenant {tenant_id} failed: {result}")
 
 
 manager = ConnectionManager()
@@ -101,8 +113,16 @@ async def websocket_endpoint(websocket: WebSocket):
             data = await websocket.receive_json()
             
             if data.get("type") == "chat":
-                # Process chat message
-                question = Question(question=data.get("message", ""))
+                # Process chat message; the length check mirrors Question's
+                # field constraints so model validation can be skipped
+                message = data.get("message") or ""
+                if not isinstance(message, str) or not 1 <= len(message) <= 2000:
+                    await websocket.send_json({
+                        "type": "error",
+                        "detail": "invalid message"
+                    })
+                    continue
+                question = Question.model_construct(question=message)
                 
                 # Send typing indicator
                 await manager.broadcast_to_tenant(tenant_id, {
@@ -0,0 +1,12 @@
+import os
+import sys
+from pathlib import Path
+
+# Make the ``app`` package importable when pytest runs from any directory
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+# Fixed settings so importing app.config has no side effects
+os.environ.setdefault("ENCRYPTION_KEY", "3Z0lVYzTj0Xa5b8oJ3kq2Q7s9yXwVtHcA1mNbRfGdUE=")
+os.environ.setdefault("JWT_SECRET_KEY", "test-secret-key-for-the-unit-tests-only")
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+os.environ.setdefault("ENABLE_ANALYTICS", "false")
@@ -0,0 +1,76 @@
+"""Guard the model_construct call sites against schema drift.
+
+model_construct skips validation, so a renamed or newly required field
+would go unnoticed at these sites; round-tripping through model_validate
+catches it.
+"""
+
+from datetime import datetime
+
+import jwt
+
+from app.schemas_enhanced import Answer, DocumentInfo
+
+
+def test_answer_construct_matches_schema():
+    # Fields set by VectorStoreManager.ask_question
+    fields = {
+        "answer": "text",
+        "sources": ["a.pdf"],
+        "source_details": [{"source": "a.pdf", "score": 0.5, "preview": "..."}],
+        "confidence": 50.0,
+        "model_used": "grok",
+    }
+    answer = Answer.model_construct(**fields)
+    assert set(fields) <= set(Answer.model_fields)
+    assert Answer.model_validate(answer.model_dump()) == answer
+
+
+def test_answer_construct_fallback_matches_schema():
+    answer = Answer.model_construct(answer="none", sources=[], confidence=0.0)
+    assert Answer.model_validate(answer.model_dump()) == answer
+
+
+def test_document_info_construct_matches_schema():
+    # Fields set by the /documents listing
+    meta = {"source": "a.pdf", "file_size": 10, "indexed_at": "2024-01-01T00:00:00"}
+    fields = {
+        "id": "file-1",
+        "name": meta["source"],
+        "size": meta["file_size"],
+        "uploaded_at": datetime.fromisoformat(meta["indexed_at"]),
+        "metadata": meta,
+    }
+    info = DocumentInfo.model_construct(**fields)
+    assert set(fields) <= set(DocumentInfo.model_fields)
+    assert DocumentInfo.model_validate(info.model_dump()) == info
+
+
+def _token(**claims):
+    from app.config import JWT_ALGORITHM, JWT_SECRET_KEY
+
+    payload = {"sub": "u1", "tenant_id": "t1", "exp": 4102444800, **claims}
+    return jwt.encode(payload, JWT_SECRET_KEY, algorithm=JWT_ALGORITHM)
+
+
+def test_verify_token_validates_claims():
+    from app.security_enhanced import verify_token
+
+    user = verify_token(_token(is_admin="false", permissions=["read"]))
+    assert user is not None
+    assert user.is_admin is False
+    assert user.permissions == ["read"]
+
+
+def test_verify_token_rejects_malformed_claims():
+    from app.security_enhanced import verify_token
+
+    assert verify_token(_token(permissions="admin")) is None
+
+
+def test_verify_token_does_not_share_permissions():
+    from app.security_enhanced import verify_token
+
+    token = _token(permissions=["read"])
+    verify_token(token).permissions.append("admin")
+    assert verify_token(token).permissions == ["read"]